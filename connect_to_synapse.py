@@ -7,19 +7,108 @@
 
 import synapseclient
 import requests
+import hashlib
 import json
+import os
+import threading
+import time
 
-syn = synapseclient.Synapse()
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Base URLs can be overridden (e.g. to point at a local stub server)
+AUTH_ENDPOINT = os.environ.get('SYNAPSE_AUTH_ENDPOINT',
+                               'https://repo-prod.prod.sagebase.org/auth/v1')
+REPO_ENDPOINT = os.environ.get('SYNAPSE_REPO_ENDPOINT',
+                               'https://repo-prod.prod.sagebase.org/repo/v1')
+FILE_ENDPOINT = os.environ.get('SYNAPSE_FILE_ENDPOINT',
+                               'https://repo-prod.prod.sagebase.org/file/v1')
+PORTAL_ENDPOINT = os.environ.get('SYNAPSE_PORTAL_ENDPOINT', 'https://www.synapse.org/')
+REQUEST_TIMEOUT = 10    # seconds
+CACHE_TTL = 300         # seconds
+CACHE_MAXSIZE = 1024    # entries per cache
+DOWNLOAD_DIR = 'data'
+
+syn = synapseclient.Synapse(repoEndpoint=REPO_ENDPOINT, authEndpoint=AUTH_ENDPOINT,
+                            fileHandleEndpoint=FILE_ENDPOINT, portalEndpoint=PORTAL_ENDPOINT)
+
+# One pooled HTTP session shared by every REST call
+session = requests.Session()
+session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+class TTLCache(object):
+  """thread-safe dict whose entries expire after ttl seconds, holding at most
+  maxsize entries (oldest evicted first)"""
+
+  def __init__(self, ttl=CACHE_TTL, maxsize=CACHE_MAXSIZE):
+    self.ttl = ttl
+    self.maxsize = maxsize
+    self._data = OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    with self._lock:
+      return len(self._data)
+
+  def get(self, key):
+    with self._lock:
+      entry = self._data.get(key)
+      if entry is None:
+        return None
+      value, expires = entry
+      if expires < time.monotonic():
+        del self._data[key]
+        return None
+      return value
+
+  def set(self, key, value):
+    now = time.monotonic()
+    with self._lock:
+      self._data[key] = (value, now + self.ttl)
+      self._data.move_to_end(key)
+      # Entries share one ttl, so the oldest insertion expires first
+      while self._data:
+        oldest = next(iter(self._data.values()))
+        if oldest[1] >= now and len(self._data) <= self.maxsize:
+          break
+        self._data.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._data.clear()
+
+
+_userinfo_cache = TTLCache()
+_teams_cache = TTLCache()
+_projects_cache = TTLCache()
+
+def _cached_get(cache, key, url, headers=None):
+  """GETs url as JSON through the pooled session, memoized in cache under key;
+  error responses are returned as-is (like a bare requests.get) but not cached"""
+  
+  response = cache.get(key)
+  if response is None:
+    r = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    response = r.json()
+    if r.ok:
+      cache.set(key, response)
+  return(response)
+
+def clear_synapse_caches():
+  for cache in (_userinfo_cache, _teams_cache, _projects_cache):
+    cache.clear()
 
 def login_to_synapse(username, api_key):
   syn.login(email=username, apiKey=api_key, rememberMe=True)
   
 def get_synapse_userinfo(access_token):
   
-  endpoint = "https://repo-prod.prod.sagebase.org/auth/v1/oauth2/userinfo"
+  endpoint = AUTH_ENDPOINT + "/oauth2/userinfo"
   headers = {"Authorization": "Bearer " + access_token}
   
-  response = requests.get(endpoint, headers=headers).json()
+  response = _cached_get(_userinfo_cache, access_token, endpoint, headers)
   return(response)
   
 def get_synapse_user_profile():
@@ -29,20 +118,71 @@ def get_synapse_user_profile():
   
 def get_synapse_teams(user_id):
   
-  endpoint = "https://repo-prod.prod.sagebase.org/repo/v1/user/" + user_id + "/team"
-  response = requests.get(endpoint).json()
+  endpoint = REPO_ENDPOINT + "/user/" + user_id + "/team"
+  response = _cached_get(_teams_cache, user_id, endpoint)
   return(response)
   
 def get_synapse_projects(access_token):
   
-  endpoint = "https://repo-prod.prod.sagebase.org/repo/v1/projects/"
+  endpoint = REPO_ENDPOINT + "/projects/"
   headers = {"Authorization": "Bearer " + access_token}
-  response = requests.get(endpoint).json()
+  response = _cached_get(_projects_cache, access_token, endpoint, headers)
   return(response)
+
+
+# --------------------------- File downloads -----------------------------------
+
+# entity_id -> (etag, local path) of the last verified download
+_downloaded = {}
+# entity_id -> Future shared by concurrent callers of the same download
+_in_flight = {}
+_download_lock = threading.Lock()
+
+def _file_md5(path, chunk_size=1 << 20):
+  md5 = hashlib.md5()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+      md5.update(chunk)
+  return md5.hexdigest()
+
+def _download_if_changed(entity_id):
+  """downloads entity only if the local copy's etag/content MD5 is stale"""
+  
+  entity = syn.get(entity_id, downloadFile=False)
+  etag = entity.get('etag')
+  known = _downloaded.get(entity_id)
+  if known is not None and known[0] == etag and os.path.exists(known[1]):
+    return known[1]
+  
+  file_handle = entity.get('_file_handle') or {}
+  remote_md5 = file_handle.get('contentMd5')
+  local_path = os.path.join(DOWNLOAD_DIR, file_handle.get('fileName') or entity.name)
+  if remote_md5 is None or not os.path.exists(local_path) \
+      or _file_md5(local_path) != remote_md5:
+    entity = syn.get(entity_id, downloadLocation=DOWNLOAD_DIR, ifcollision='overwrite.local')
+    local_path = entity.path
+  
+  _downloaded[entity_id] = (etag, local_path)
+  return local_path
   
 def fetch_synapse_filepath(entity_id):
-  entity = syn.get(entity_id, downloadLocation='data', ifcollision='overwrite.local')
-  return(entity.path)
+  
+  with _download_lock:
+    future = _in_flight.get(entity_id)
+    owner = future is None
+    if owner:
+      future = Future()
+      _in_flight[entity_id] = future
+  
+  if owner:
+    try:
+      future.set_result(_download_if_changed(entity_id))
+    except BaseException as e:
+      future.set_exception(e)
+    finally:
+      with _download_lock:
+        del _in_flight[entity_id]
+  return(future.result())
   
 def create_prod_client():
   
@@ -1,6 +1,9 @@
 import numpy as np
 import operator
 import pandas as pd
+import threading
+
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 from glycan_processing import *
 
 df_sub = pd.read_csv('pydata/df_glyco_substitution_iso2.csv').iloc[:,1:]
@@ -473,12 +476,23 @@ class SequenceAlignment(object):
 def pairwiseAlign(input_query, corpus=list(range(len(glycobase))), n=5, database=glycobase,
                   vocab=(all_sugars+all_bonds), submat=df_sub, mismatch=-10, 
                   gap=-5, self_contain=False):
-                    
-  query = small_motif_find(input_query)
+  
+  setup = _prepareAlignment(input_query, corpus, database, vocab, submat, mismatch, gap)
   
   if n == 0:
     n = len(corpus)
     
+  track = []
+  for k in range(len(corpus)):
+    track.append(_scoreGlycan(setup, k))
+    
+  return _formatAlignments(setup, track, n, self_contain)
+
+def _prepareAlignment(input_query, corpus, database, vocab, submat, mismatch, gap):
+  """encodes query and corpus once so glycans can be scored one at a time"""
+  
+  query = small_motif_find(input_query)
+  
   a = Sequence(query.split('*'))
   v = Vocabulary()
   voc = v.encodeSequence(Sequence(vocab))
@@ -487,21 +501,27 @@ def pairwiseAlign(input_query, corpus=list(range(len(glycobase))), n=5, database
   seqs = [small_motif_find(j) for j in seqs]
   species = database.species.values.tolist()
   inf_species = database.inferred_origin.values.tolist()
+  ids = database.glycan_id.values.tolist()
   scoring = SubstitutionScoring(submat, mismatch)
   aligner = GlobalSequenceAligner(scoring, gap)
-  track = []
-
-  for k in range(len(corpus)):
-    b_enc = v.encodeSequence(Sequence(seqs[k].split('*')))
-    score, encodeds = aligner.align(a_enc, b_enc, backtrace=True)
-    origin = species[k] if isinstance(species[k], str) else inf_species[k]
-    track.append((score, encodeds, database.glycan_id.values.tolist()[k],
-                  origin, len(b_enc)))
-
-  track.sort(key = operator.itemgetter(0), reverse=True)
   
-  all_results = {'Query_Sequence': [], 'Aligned_Sequence': [], 'Score': [], 
-    'Percent_Identity': [], 'Percent_Coverage': [], 'Glycobase_ID': [], 'Species': []}
+  return {'query': a, 'query_enc': a_enc, 'vocabulary': v, 'aligner': aligner,
+          'seqs': seqs, 'species': species, 'inf_species': inf_species, 'ids': ids}
+
+def _scoreGlycan(setup, k):
+  v = setup['vocabulary']
+  species = setup['species']
+  b_enc = v.encodeSequence(Sequence(setup['seqs'][k].split('*')))
+  score, encodeds = setup['aligner'].align(setup['query_enc'], b_enc, backtrace=True)
+  origin = species[k] if isinstance(species[k], str) else setup['inf_species'][k]
+  return (score, encodeds, setup['ids'][k], origin, len(b_enc))
+
+def _formatAlignments(setup, track, n, self_contain):
+  a = setup['query']
+  v = setup['vocabulary']
+  track = sorted(track, key = operator.itemgetter(0), reverse=True)
+  
+  all_results = _emptyAlignments()
   
   if self_contain:
     ii = slice(1,n+1)
@@ -525,3 +545,114 @@ def pairwiseAlign(input_query, corpus=list(range(len(glycobase))), n=5, database
       #      str((len(a)+1)-(query.split('*')[::-1].index(alignment[-1][0])+1)))
       
   return all_results
+
+def _emptyAlignments():
+  return {'Query_Sequence': [], 'Aligned_Sequence': [], 'Score': [], 
+    'Percent_Identity': [], 'Percent_Coverage': [], 'Glycobase_ID': [], 'Species': []}
+
+
+# Alignment Jobs -------------------------------------------------------------------
+# Background threads keep the calling (reticulate) interpreter responsive while
+# a query is scored against the corpus; no external queue service is needed.
+
+ALIGNMENT_WORKERS = 2
+_alignment_executor = ThreadPoolExecutor(max_workers=ALIGNMENT_WORKERS,
+                                         thread_name_prefix='glycan-alignment')
+
+class JobCancelled(CancelledError):
+  """raised by AlignmentJob.result() for a job cancelled while running"""
+  pass
+
+class AlignmentJob(object):
+  """handle on a pairwiseAlign run executing in the background"""
+  
+  def __init__(self, input_query, corpus=list(range(len(glycobase))), n=5,
+               database=glycobase, vocab=(all_sugars+all_bonds), submat=df_sub,
+               mismatch=-10, gap=-5, self_contain=False, executor=None):
+    self.total = len(corpus)
+    self.n = self.total if n == 0 else n
+    self.self_contain = self_contain
+    self._track = []
+    self._setup = None
+    self._lock = threading.Lock()
+    self._cancel = threading.Event()
+    self._finished = False
+    if executor is None:
+      executor = _alignment_executor
+    self._future = executor.submit(self._run, input_query, corpus, database,
+                                   vocab, submat, mismatch, gap)
+    
+  def _run(self, *args):
+    # Checking the cancel flag and marking the job finished under one lock
+    # means a cancel() that returns True always ends in JobCancelled.
+    try:
+      results = self._align(*args)
+    except BaseException as e:
+      with self._lock:
+        self._finished = True
+        if self._cancel.is_set() and not isinstance(e, JobCancelled):
+          raise JobCancelled() from e
+      raise
+    with self._lock:
+      self._finished = True
+      if self._cancel.is_set():
+        raise JobCancelled()
+    return results
+  
+  def _align(self, input_query, corpus, database, vocab, submat, mismatch, gap):
+    setup = _prepareAlignment(input_query, corpus, database, vocab, submat, mismatch, gap)
+    self._setup = setup
+    for k in range(self.total):
+      if self._cancel.is_set():
+        raise JobCancelled()
+      scored = _scoreGlycan(setup, k)
+      with self._lock:
+        self._track.append(scored)
+    return _formatAlignments(setup, self._track, self.n, self.self_contain)
+  
+  def progress(self):
+    """fraction of the corpus scored so far"""
+    if self.total == 0:
+      return 1.0
+    with self._lock:
+      return len(self._track) / self.total
+  
+  def partial_results(self, n=None):
+    """top-n alignments among the glycans scored so far"""
+    if self._setup is None:
+      return _emptyAlignments()
+    with self._lock:
+      track = list(self._track)
+    return _formatAlignments(self._setup, track, self.n if n is None else n,
+                             self.self_contain)
+  
+  def result(self, timeout=None):
+    """final results; raises CancelledError (JobCancelled if it was already
+    running) when the job was cancelled"""
+    return self._future.result(timeout)
+  
+  def cancel(self):
+    """stops the job unless it already finished; returns whether it will stop"""
+    with self._lock:
+      if self._finished:
+        return False
+      self._cancel.set()
+    self._future.cancel()
+    return True
+    
+  def cancelled(self):
+    return self._cancel.is_set()
+  
+  def done(self):
+    return self._future.done()
+  
+  def status(self):
+    if self.cancelled():
+      return 'cancelled'
+    if not self._future.done():
+      return 'running' if self._future.running() else 'pending'
+    return 'failed' if self._future.exception() is not None else 'finished'
+    
+def submitAlignment(input_query, **kwargs):
+  """starts pairwiseAlign in the background and returns its AlignmentJob"""
+  return AlignmentJob(input_query, **kwargs)
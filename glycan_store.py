@@ -0,0 +1,188 @@
+import pickle
+import time
+
+from collections import Counter
+from glycan_processing import glycobase, df_species, all_bonds, all_sugars, link_find, small_motif_find
+from glycan_alignment import Sequence, Vocabulary
+from structural_context import branch_position_counts, candidate_glycoletters, taxonomy_key
+
+#### INCREMENTAL DATABASE STORE ####
+MAIN = 'main'
+SIDE = 'side'
+
+# Store -----------------------------------------------------------------------
+
+class GlycanStore(object):
+    """encoded glycans plus motif and branch statistics, updatable by glycan_id
+
+    Glycans come from a glycobase-shaped table (glycan_id, glycan); their
+    taxonomy comes from df_species-shaped rows (target, species, kingdom),
+    the same table the context tab and StructuralStatistics slice. Every
+    species row of a glycan adds its motifs and branch positions to the
+    ('All', 'All'), ('Kingdom', kingdom) and ('Species', species) slices,
+    so lookups agree with main_v_side_branch for the same df_species.
+
+    A full build is just an update that adds every row, so a store built
+    from a release and a store brought up to that release with update()
+    hold the same artifacts. Codes of elements already in the vocabulary
+    never change; elements outside the seed vocabulary are appended in the
+    order they are first seen, so their codes depend on update history and
+    artifacts() compares sequences by element instead.
+    """
+
+    def __init__(self, vocab=(all_sugars+all_bonds)):
+        self.vocabulary = Vocabulary()
+        self.vocabulary.encodeSequence(Sequence(vocab))
+        self.seed_size = len(self.vocabulary)
+        self.glycoletters = list(dict.fromkeys(vocab))
+        self.sequences = dict()       # glycan_id -> EncodedSequence
+        self.motif_counts = dict()    # slice -> Counter of link_find motifs
+        self.branch_counts = dict()   # slice -> Counter of (glycoletter, MAIN/SIDE)
+        self.slice_sizes = Counter()  # slice -> number of species rows
+        self._rows = dict()           # glycan_id -> (glycan, taxa, motifs, branches)
+        self._letters_in = dict()     # element -> glycoletters it contains
+
+    @classmethod
+    def build(cls, database=glycobase, species_df=df_species, **kwargs):
+        store = cls(**kwargs)
+        store.update(added=database, species_df=species_df)
+        return store
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, glycan_id):
+        return glycan_id in self._rows
+
+    # Updates -----------------------------------------------------------------
+
+    def update(self, added=None, removed=None, changed=None, species_df=df_species):
+        """applies a delta: removed is a list of glycan_ids, added and changed
+        are DataFrames with glycan_id and glycan columns whose taxonomy is
+        read from species_df"""
+        if removed is not None:
+            for glycan_id in removed:
+                self._remove(glycan_id)
+        for rows in (changed, added):
+            if rows is None:
+                continue
+            glycans = rows.glycan.values.tolist()
+            taxonomy = _taxonomy(species_df[species_df.target.isin(glycans)])
+            for glycan_id, glycan in zip(rows.glycan_id.values.tolist(), glycans):
+                if glycan_id in self._rows:
+                    self._remove(glycan_id)
+                self._add(glycan_id, glycan, taxonomy.get(glycan, ()))
+
+    def sync(self, database, species_df=df_species):
+        """brings the store up to database and species_df, touching only
+        glycans whose sequence or taxonomy differ"""
+        taxonomy = _taxonomy(species_df)
+        incoming = dict()
+        for glycan_id, glycan in zip(database.glycan_id.values.tolist(),
+                                     database.glycan.values.tolist()):
+            incoming[glycan_id] = (glycan, taxonomy.get(glycan, ()))
+        removed = [k for k in self._rows if k not in incoming]
+        mask = [k not in self._rows or self._rows[k][:2] != incoming[k]
+                for k in database.glycan_id.values.tolist()]
+        self.update(added=database[mask], removed=removed, species_df=species_df)
+        return len(removed), sum(mask)
+
+    def _add(self, glycan_id, glycan, taxa):
+        elements = small_motif_find(glycan).split('*')
+        self.sequences[glycan_id] = self.vocabulary.encodeSequence(
+            Sequence(elements, id=glycan_id))
+
+        motifs = Counter(link_find(glycan))
+        branches = Counter()
+        for letter in candidate_glycoletters(elements, self.glycoletters, self._letters_in):
+            main, side = branch_position_counts(glycan, letter)
+            if main:
+                branches[(letter, MAIN)] = main
+            if side:
+                branches[(letter, SIDE)] = side
+
+        for key in _slices(taxa):
+            self.slice_sizes[key] += 1
+            self.motif_counts.setdefault(key, Counter()).update(motifs)
+            self.branch_counts.setdefault(key, Counter()).update(branches)
+        self._rows[glycan_id] = (glycan, taxa, motifs, branches)
+
+    def _remove(self, glycan_id):
+        glycan, taxa, motifs, branches = self._rows.pop(glycan_id)
+        del self.sequences[glycan_id]
+        for key in _slices(taxa):
+            self.motif_counts[key] -= motifs
+            self.branch_counts[key] -= branches
+            self.slice_sizes[key] -= 1
+            if not self.slice_sizes[key]:
+                del self.slice_sizes[key]
+                del self.motif_counts[key]
+                del self.branch_counts[key]
+
+    # Lookups -----------------------------------------------------------------
+
+    def main_v_side_branch(self, glycoletter, taxonomy_filter='Kingdom', taxonomy_value='All'):
+        counts = self.branch_counts.get(taxonomy_key(taxonomy_filter, taxonomy_value), Counter())
+        return counts[(glycoletter, MAIN)], counts[(glycoletter, SIDE)]
+
+    def artifacts(self):
+        """plain, comparable snapshot of everything the store derives"""
+        elements = self.vocabulary.elements()
+        return {
+            'vocabulary': elements[:self.seed_size] + sorted(elements[self.seed_size:]),
+            'sequences': {k: tuple(self.vocabulary.decodeSequence(v))
+                          for k, v in self.sequences.items()},
+            'motif_counts': {k: dict(v) for k, v in self.motif_counts.items()},
+            'branch_counts': {k: dict(v) for k, v in self.branch_counts.items()},
+            'slice_sizes': dict(self.slice_sizes),
+        }
+
+    # Persistence -------------------------------------------------------------
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            pickle.dump(self, file)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+
+
+def _taxonomy(species_df):
+    """glycan -> sorted tuple of its (species, kingdom) rows, duplicates kept"""
+    taxonomy = dict()
+    for glycan, species, kingdom in zip(species_df.target.values.tolist(),
+                                        species_df.species.values.tolist(),
+                                        species_df.kingdom.values.tolist()):
+        taxonomy.setdefault(glycan, []).append((species, kingdom))
+    return {k: tuple(sorted(v)) for k, v in taxonomy.items()}
+
+def _slices(taxa):
+    for species, kingdom in taxa:
+        yield ('All', 'All')
+        yield ('Kingdom', kingdom)
+        yield ('Species', species)
+
+
+# Benchmark -------------------------------------------------------------------
+# Correctness (sync vs. full build, agreement with main_v_side_branch) is
+# covered by tests/test_glycan_store.py; this reports the cost of a 1% delta.
+
+if __name__ == '__main__':
+    t = time.time()
+    full = GlycanStore.build()
+    build_seconds = time.time() - t
+
+    delta = glycobase.sample(frac=0.01, random_state=0)
+    removed_ids = delta.glycan_id.values[:len(delta) // 2]
+    changed_ids = delta.glycan_id.values[len(delta) // 2:]
+    previous = glycobase[~glycobase.glycan_id.isin(removed_ids)].copy()
+    previous.loc[previous.glycan_id.isin(changed_ids), 'glycan'] = 'Gal(b1-4)Glc'
+    store = GlycanStore.build(previous)
+
+    t = time.time()
+    n_removed, n_updated = store.sync(glycobase)
+    sync_seconds = time.time() - t
+    print('full build: %.2fs; sync of %d updated rows: %.3fs (%.1f%% of build)'
+          % (build_seconds, n_updated, sync_seconds, 100 * sync_seconds / build_seconds))
@@ -0,0 +1,188 @@
+import hashlib
+import numpy as np
+import pandas as pd
+import time
+
+from glycan_processing import glycobase, link_find
+
+#### APPROXIMATE SIMILARITY SEARCH ####
+# MinHash signatures of link_find motif sets, bucketed with LSH. The index holds
+# only glycan ids and a compact uint32 signature array, which can be saved to
+# disk; buckets are rebuilt on load and glycan strings come from the database.
+
+MERSENNE_PRIME = (1 << 31) - 1
+EMPTY_SLOT = MERSENNE_PRIME    # signature value for glycans without motifs
+
+def motif_hash(motif):
+  """stable 31-bit hash of a motif string (Python's hash() is salted per process)"""
+  digest = hashlib.blake2b(motif.encode('utf-8'), digest_size=8).digest()
+  return int.from_bytes(digest, 'little') % MERSENNE_PRIME
+
+class MotifIndex(object):
+  """MinHash/LSH index over the disaccharide motif sets of a glycan database"""
+
+  def __init__(self, num_perm=128, bands=32, seed=1):
+    if num_perm % bands != 0:
+      raise ValueError('num_perm (%d) must be a multiple of bands (%d)' % (num_perm, bands))
+    self.num_perm = num_perm
+    self.bands = bands
+    self.seed = seed
+    rng = np.random.RandomState(seed)
+    self.a = rng.randint(1, MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+    self.b = rng.randint(0, MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+    self.glycan_ids = np.zeros(0, np.int64)
+    self.signatures = np.zeros((0, num_perm), np.uint32)
+    self.buckets = []
+    self._positions = (None, None)    # (database, its row position per index row)
+
+  @classmethod
+  def build(cls, database=glycobase, **kwargs):
+    index = cls(**kwargs)
+    glycans = database.glycan.values.tolist()
+    index.glycan_ids = np.array(database.glycan_id.values.tolist(), np.int64)
+    index.signatures = np.array([index.signature(k) for k in glycans], np.uint32) \
+      .reshape(len(glycans), index.num_perm)
+    index._bucket()
+    return index
+
+  def signature(self, glycan):
+    motifs = link_find(glycan)
+    if not motifs:
+      return np.full(self.num_perm, EMPTY_SLOT, np.uint32)
+    x = np.array([motif_hash(k) for k in motifs], np.uint64)
+    # (a*x + b) mod p stays below 2**62, so uint64 cannot overflow
+    h = (np.outer(x, self.a) + self.b) % np.uint64(MERSENNE_PRIME)
+    return h.min(axis=0).astype(np.uint32)
+
+  def _band_keys(self, signatures, band):
+    rows = self.num_perm // self.bands
+    chunk = np.ascontiguousarray(signatures[:, band*rows:(band+1)*rows])
+    return [k.tobytes() for k in chunk]
+
+  def _bucket(self):
+    self.buckets = []
+    for band in range(self.bands):
+      table = {}
+      for i, key in enumerate(self._band_keys(self.signatures, band)):
+        table.setdefault(key, []).append(i)
+      self.buckets.append(table)
+
+  def candidates(self, sig):
+    """rows sharing at least one LSH band with the signature"""
+    found = set()
+    for band in range(self.bands):
+      key = self._band_keys(sig.reshape(1, -1), band)[0]
+      found.update(self.buckets[band].get(key, ()))
+    return np.array(sorted(found), np.int64)
+
+  def query(self, glycan, n=10, exhaustive=False, rescore=False, shortlist=None,
+            database=glycobase, **align_kwargs):
+    """glycans ranked by estimated Jaccard similarity of their motif sets
+
+    With exhaustive=True every signature is compared instead of only the LSH
+    candidates. Glycan strings are looked up in database, which should be
+    the table the index was built from. With rescore=True the best shortlist
+    (default 5*n) candidates are re-ranked with pairwiseAlign
+    (GlobalSequenceAligner) and its top-n alignment results are returned,
+    with an Estimated_Jaccard column added.
+    """
+    if rescore and shortlist is None:
+      shortlist = 5 * n
+    sig = self.signature(glycan)
+    if exhaustive:
+      rows = np.arange(len(self.glycan_ids))
+    else:
+      rows = self.candidates(sig)
+    jaccard = (self.signatures[rows] == sig).mean(axis=1) if len(rows) else np.zeros(0)
+    order = np.argsort(-jaccard, kind='stable')[:shortlist if rescore else n]
+    rows = rows[order]
+    jaccard = jaccard[order]
+
+    matches = self._rows_in(database, rows)
+    if rescore:
+      return self._rescore(glycan, rows, jaccard, n, matches, **align_kwargs)
+    return {'Glycobase_ID': ['GBID{}'.format(k) for k in self.glycan_ids[rows]],
+            'Glycan': matches.glycan.values.tolist(),
+            'Estimated_Jaccard': jaccard.tolist()}
+
+  def _rows_in(self, database, rows):
+    """rows of database for index rows, in that order; the id -> position
+    mapping is built once per database object and reused by later queries"""
+    cached, positions = self._positions
+    if cached is not database:
+      positions = pd.Index(database.glycan_id.values).get_indexer(self.glycan_ids)
+      self._positions = (database, positions)
+    positions = positions[rows]
+    if (positions < 0).any():
+      raise KeyError('glycan ids missing from database: %r'
+                     % self.glycan_ids[rows][positions < 0].tolist())
+    return database.iloc[positions]
+
+  def _rescore(self, glycan, rows, jaccard, n, matches, **align_kwargs):
+    from glycan_alignment import pairwiseAlign
+    results = pairwiseAlign(glycan, corpus=list(range(len(matches))), n=n,
+                            database=matches, **align_kwargs)
+    estimated = dict(zip(['GBID{}'.format(k) for k in self.glycan_ids[rows]], jaccard.tolist()))
+    results['Estimated_Jaccard'] = [estimated[k] for k in results['Glycobase_ID']]
+    return results
+
+  # Persistence -----------------------------------------------------------------
+
+  def save(self, path):
+    np.savez_compressed(path, signatures=self.signatures, glycan_ids=self.glycan_ids,
+                        params=np.array([self.num_perm, self.bands, self.seed], np.int64))
+
+  @classmethod
+  def load(cls, path):
+    with np.load(path) as data:
+      num_perm, bands, seed = data['params'].tolist()
+      index = cls(num_perm=num_perm, bands=bands, seed=seed)
+      index.signatures = data['signatures']
+      index.glycan_ids = data['glycan_ids']
+    index._bucket()
+    return index
+
+
+# Benchmark -------------------------------------------------------------------
+
+def benchmark_index(index, queries, n=10, database=glycobase):
+  """latency of approximate search and its recall of the exact top-n alignments;
+  index must have been built from database"""
+
+  from glycan_alignment import pairwiseAlign
+  corpus = list(range(len(database)))
+
+  approx_times = []
+  exact_times = []
+  recalls = []
+  rescored_recalls = []
+  for q in queries:
+    t = time.time()
+    approx = index.query(q, n=n, database=database)
+    approx_times.append(time.time() - t)
+
+    t = time.time()
+    exact = pairwiseAlign(q, corpus=corpus, n=n, database=database)
+    exact_times.append(time.time() - t)
+
+    rescored = index.query(q, n=n, rescore=True, database=database)
+
+    exact_ids = set(exact['Glycobase_ID'])
+    if exact_ids:
+      recalls.append(len(exact_ids & set(approx['Glycobase_ID'])) / len(exact_ids))
+      rescored_recalls.append(len(exact_ids & set(rescored['Glycobase_ID'])) / len(exact_ids))
+
+  return {'queries': len(queries), 'n': n,
+          'recall': float(np.mean(recalls)) if recalls else float('nan'),
+          'recall_rescored': float(np.mean(rescored_recalls)) if rescored_recalls else float('nan'),
+          'approx_seconds': float(np.mean(approx_times)),
+          'exact_seconds': float(np.mean(exact_times))}
+
+if __name__ == '__main__':
+  # Exact alignment is slow, so recall is measured on a slice of the database
+  database = glycobase.iloc[:2000]
+  t = time.time()
+  index = MotifIndex.build(database)
+  print('built index of %d glycans in %.1fs' % (len(index.glycan_ids), time.time() - t))
+  sample = database.glycan.sample(5, random_state=0).values.tolist()
+  print(benchmark_index(index, sample, n=10, database=database))
@@ -1,5 +1,6 @@
 from collections import Counter
-from glycan_processing import df_species, link_find
+from glycan_processing import df_species, all_bonds, all_sugars, link_find, small_motif_find
+import pandas as pd
 import pickle
 import re
 
@@ -18,18 +19,49 @@ def main_v_side_branch(glycoletter, taxonomy_filter = 'Kingdom', taxonomy_value
   main = 0
   side = 0
   for k in range(len(glycan_list)):
-    starts = [m.start() for m in re.finditer(glycoletter, glycan_list[k])]
-    init = 0
-    for i in starts:
-      gly = glycan_list[k][init:i]
-      if '[' in gly and ']' not in gly:
-        side += 1
-      else:
-        main += 1
-      init = i
+    m, s = branch_position_counts(glycan_list[k], glycoletter)
+    main += m
+    side += s
       
   return main, side
 
+def branch_position_counts(glycan, glycoletter):
+  """counts occurrences of glycoletter in main versus side branch of one glycan"""
+  
+  positions = [k[0] for k in branch_occurrences(glycan, glycoletter)]
+  return positions.count('main'), positions.count('side')
+
+def branch_occurrences(glycan, glycoletter):
+  """(position, depth) of every occurrence of glycoletter in one glycan"""
+  
+  occurrences = []
+  starts = [m.start() for m in re.finditer(glycoletter, glycan)]
+  init = 0
+  for i in starts:
+    gly = glycan[init:i]
+    if '[' in gly and ']' not in gly:
+      position = 'side'
+    else:
+      position = 'main'
+    depth = glycan.count('[', 0, i) - glycan.count(']', 0, i)
+    occurrences.append((position, depth))
+    init = i
+  
+  return occurrences
+
+def candidate_glycoletters(elements, glycoletters, cache):
+  """glycoletters that occur inside any of a glycan's elements; cache maps
+  element -> glycoletters and is filled as elements are seen"""
+  
+  letters = set()
+  for element in set(elements):
+    found = cache.get(element)
+    if found is None:
+      found = [k for k in glycoletters if k in element]
+      cache[element] = found
+    letters.update(found)
+  return letters
+
 def characterize_context(glycoletter, mode = 'bond', taxonomy_filter = 'Kingdom', taxonomy_value = 'All'):
   """get characteristic microenvironment for glycoletter"""
   
@@ -59,3 +91,142 @@ def characterize_context(glycoletter, mode = 'bond', taxonomy_filter = 'Kingdom'
   lab = lab + ' (' + taxonomy_filter + ' = ' + taxonomy_value + ')'
   
   return lab, cou_k, cou_v
+
+
+# ----------------------- Bulk structural statistics ---------------------------
+# One long-format table per statistic, aggregated with a single groupby over every
+# glycoletter x taxonomy value, so the per-call functions above become lookups.
+
+CONTEXT_LABELS = {
+  'bond': 'Observed monosaccharides making bond %s',
+  'sugar': 'Observed monosaccharides paired with %s',
+  'sugarbond': 'Observed bonds made by %s',
+}
+# mode -> (glycoletter part, partner part) of a 'sugar*bond*sugar' motif
+CONTEXT_PARTS = {
+  'bond': ('bond', 'first'),
+  'sugar': ('first', 'second'),
+  'sugarbond': ('first', 'bond'),
+}
+
+def taxonomy_key(taxonomy_filter, taxonomy_value):
+  """(taxonomy_filter, taxonomy_value) slice that the per-call functions filter df_species to"""
+  
+  if taxonomy_value == 'All':
+    return ('All', 'All')
+  return ('Kingdom' if taxonomy_filter == 'Kingdom' else 'Species', taxonomy_value)
+
+def _by_taxonomy(long_df):
+  """stacks long_df once per taxonomy level: Kingdom, Species and All"""
+  
+  frames = []
+  for taxonomy_filter, column in (('Kingdom', 'kingdom'), ('Species', 'species'), ('All', None)):
+    frame = long_df.drop(columns=['kingdom', 'species'])
+    frame.insert(0, 'taxonomy_filter', taxonomy_filter)
+    frame.insert(1, 'taxonomy_value', 'All' if column is None else long_df[column].values)
+    frames.append(frame)
+  return pd.concat(frames, ignore_index=True)
+
+def context_statistics(glycans_df = df_species):
+  """counts of every (glycoletter, partner) pair per mode and taxonomy value"""
+  
+  motifs = {k: link_find(k) for k in glycans_df.target.unique()}
+  long_df = glycans_df[['target', 'kingdom', 'species']].copy()
+  long_df['motif'] = long_df.target.map(motifs)
+  long_df = long_df.explode('motif').dropna(subset=['motif'])
+  # pool order, used to break count ties the way Counter.most_common() does
+  long_df['order'] = range(len(long_df))
+  parts = long_df.motif.str.split('*', n=2, expand=True).reindex(columns=[0, 1, 2])
+  parts.columns = ['first', 'bond', 'second']
+  
+  frames = []
+  for mode, (letter, partner) in CONTEXT_PARTS.items():
+    frames.append(pd.DataFrame({
+      'kingdom': long_df.kingdom.values, 'species': long_df.species.values,
+      'mode': mode, 'glycoletter': parts[letter].values,
+      'partner': parts[partner].values, 'order': long_df.order.values}))
+  long_df = _by_taxonomy(pd.concat(frames, ignore_index=True))
+  
+  keys = ['taxonomy_filter', 'taxonomy_value', 'mode', 'glycoletter', 'partner']
+  stats = long_df.groupby(keys, sort=False).order.agg(['size', 'min']).reset_index()
+  stats = stats.rename(columns={'size': 'count', 'min': 'order'})
+  stats = stats.sort_values(keys[:4] + ['count', 'order'],
+                            ascending=[True]*4 + [False, True], ignore_index=True)
+  return stats.drop(columns='order')
+
+GLYCOLETTERS = list(dict.fromkeys(all_sugars + all_bonds))
+
+def branch_statistics(glycans_df = df_species, glycoletters = GLYCOLETTERS):
+  """occurrences of every glycoletter per branch position, depth and taxonomy value"""
+  
+  cache = {}
+  occurrences = {}
+  for glycan in glycans_df.target.unique():
+    elements = small_motif_find(glycan).split('*')
+    occurrences[glycan] = [(letter,) + k
+                           for letter in candidate_glycoletters(elements, glycoletters, cache)
+                           for k in branch_occurrences(glycan, letter)]
+  long_df = glycans_df[['target', 'kingdom', 'species']].copy()
+  long_df['occurrence'] = long_df.target.map(occurrences)
+  long_df = long_df.explode('occurrence').dropna(subset=['occurrence'])
+  long_df = pd.DataFrame({
+    'kingdom': long_df.kingdom.values, 'species': long_df.species.values,
+    'glycoletter': [k[0] for k in long_df.occurrence],
+    'position': [k[1] for k in long_df.occurrence],
+    'depth': [k[2] for k in long_df.occurrence]})
+  long_df = _by_taxonomy(long_df)
+  
+  keys = ['taxonomy_filter', 'taxonomy_value', 'glycoletter', 'position', 'depth']
+  return long_df.groupby(keys).size().rename('count').reset_index()
+
+class StructuralStatistics(object):
+  """precomputed context and branch statistics with O(1) per-glycoletter lookups
+
+  Context lookups cover every glycoletter, since motifs are matched exactly.
+  Branch lookups substring-match like main_v_side_branch, so only the
+  glycoletters the branch table was computed for can be answered; others
+  raise KeyError.
+  """
+  
+  def __init__(self, context, branches, glycoletters = GLYCOLETTERS):
+    self.context = context
+    self.branches = branches
+    self.glycoletters = frozenset(glycoletters)
+    self._context = {}
+    for key, group in context.groupby(['taxonomy_filter', 'taxonomy_value', 'mode', 'glycoletter'],
+                                      sort=False):
+      group = group[group['count'] > 10]
+      self._context[key] = (group.partner.tolist(), group['count'].tolist())
+    self._branches = {}
+    totals = branches.groupby(['taxonomy_filter', 'taxonomy_value', 'glycoletter', 'position'])['count'].sum()
+    for (taxonomy_filter, taxonomy_value, glycoletter, position), count in totals.items():
+      main_side = self._branches.setdefault((taxonomy_filter, taxonomy_value, glycoletter), [0, 0])
+      main_side[0 if position == 'main' else 1] = int(count)
+  
+  @classmethod
+  def compute(cls, glycans_df = df_species, glycoletters = GLYCOLETTERS):
+    return cls(context_statistics(glycans_df), branch_statistics(glycans_df, glycoletters),
+               glycoletters)
+  
+  def save(self, path):
+    with open(path, 'wb') as file:
+      pickle.dump((self.context, self.branches, sorted(self.glycoletters)), file)
+  
+  @classmethod
+  def load(cls, path):
+    with open(path, 'rb') as file:
+      return cls(*pickle.load(file))
+  
+  def main_v_side_branch(self, glycoletter, taxonomy_filter = 'Kingdom', taxonomy_value = 'All'):
+    if glycoletter not in self.glycoletters:
+      raise KeyError('branch statistics were not computed for glycoletter %r' % glycoletter)
+    key = taxonomy_key(taxonomy_filter, taxonomy_value) + (glycoletter,)
+    main, side = self._branches.get(key, (0, 0))
+    return main, side
+  
+  def characterize_context(self, glycoletter, mode = 'bond', taxonomy_filter = 'Kingdom', taxonomy_value = 'All'):
+    key = taxonomy_key(taxonomy_filter, taxonomy_value) + (mode, glycoletter)
+    cou_k, cou_v = self._context.get(key, ([], []))
+    lab = CONTEXT_LABELS[mode] % glycoletter
+    lab = lab + ' (' + taxonomy_filter + ' = ' + taxonomy_value + ')'
+    return lab, list(cou_k), list(cou_v)
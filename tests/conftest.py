@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The app's modules live at the repository root, are imported by name and
+# read their data from pydata/ relative to it, as they do under Shiny
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
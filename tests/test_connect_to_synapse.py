@@ -0,0 +1,192 @@
+import hashlib
+import http.server
+import json
+import os
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('synapseclient')
+from synapseclient.core.cache import Cache
+
+
+class StubSynapse(object):
+  """minimal Synapse REST stub serving one file entity (syn1) and the
+  userinfo, team and project endpoints; tokens starting with 'good' are valid"""
+
+  def __init__(self):
+    self.reset()
+    stub = self
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+      def _handle(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        authorization = self.headers.get('Authorization')
+        stub.requests.append((self.path, authorization))
+        code, payload, content_type = stub.route(self.path, self.server.server_port,
+                                                 authorization)
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+      do_GET = do_POST = do_PUT = _handle
+
+      def log_message(self, *args):
+        pass
+
+    self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    self.url = 'http://127.0.0.1:%d' % self.server.server_port
+
+  def reset(self):
+    self.content = b'glycan_id,glycan\n1,Gal(b1-4)Glc\n'
+    self.etag = 'etag-1'
+    self.download_delay = 0
+    self.downloads = 0
+    self.requests = []
+
+  def hits(self, path):
+    return [authorization for p, authorization in self.requests if p == path]
+
+  def route(self, path, port, authorization):
+    authorized = (authorization or '').startswith('Bearer good')
+    if path == '/auth/v1/oauth2/userinfo':
+      if not authorized:
+        return self._json({'reason': 'invalid token'}, 401)
+      return self._json({'userid': '273', 'token': authorization})
+    if path.startswith('/repo/v1/user/') and path.endswith('/team'):
+      return self._json({'results': [{'id': '9', 'name': 'GlycoBase',
+                                      'member': path.split('/')[4]}]})
+    if path == '/repo/v1/projects/':
+      if not authorized:
+        return self._json({'reason': 'invalid token'}, 401)
+      return self._json({'results': [{'id': 'syn0', 'name': 'GlycoBase'}]})
+
+    md5 = hashlib.md5(self.content).hexdigest()
+    file_handle = {'id': str(int(md5[:8], 16)), 'etag': md5, 'fileName': 'glycobase.csv',
+                   'concreteType': 'org.sagebionetworks.repo.model.file.S3FileHandle',
+                   'contentMd5': md5, 'contentSize': len(self.content),
+                   'contentType': 'text/csv'}
+    if path.endswith('/entity/syn1/bundle2'):
+      entity = {'concreteType': 'org.sagebionetworks.repo.model.FileEntity',
+                'id': 'syn1', 'name': 'glycobase.csv', 'etag': self.etag,
+                'dataFileHandleId': file_handle['id'], 'versionNumber': 1,
+                'parentId': 'syn0'}
+      return self._json({'entity': entity, 'fileHandles': [file_handle],
+                         'annotations': {'id': 'syn1', 'etag': self.etag, 'annotations': {}},
+                         'restrictionInformation': {'hasUnmetAccessRequirement': False}})
+    if path.endswith('/fileHandle/batch'):
+      url = 'http://127.0.0.1:%d/download/glycobase.csv' % port
+      return self._json({'requestedFiles': [{'fileHandleId': file_handle['id'],
+                                             'fileHandle': file_handle,
+                                             'preSignedURL': url}]})
+    if path.startswith('/download/'):
+      self.downloads += 1
+      time.sleep(self.download_delay)
+      return 200, self.content, 'text/csv'
+    return 404, b'{"reason": "not found"}', 'application/json'
+
+  def _json(self, payload, code=200):
+    return code, json.dumps(payload).encode(), 'application/json'
+
+
+STUB = StubSynapse()
+os.environ['SYNAPSE_REPO_ENDPOINT'] = STUB.url + '/repo/v1'
+os.environ['SYNAPSE_AUTH_ENDPOINT'] = STUB.url + '/auth/v1'
+os.environ['SYNAPSE_FILE_ENDPOINT'] = STUB.url + '/file/v1'
+os.environ['SYNAPSE_PORTAL_ENDPOINT'] = STUB.url + '/'
+
+import connect_to_synapse as synapse
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(tmp_path, monkeypatch):
+  STUB.reset()
+  monkeypatch.setattr(synapse, 'DOWNLOAD_DIR', str(tmp_path / 'data'))
+  # the client's own file cache would otherwise serve repeat downloads
+  monkeypatch.setattr(synapse.syn, 'cache', Cache(str(tmp_path / 'cache')))
+  synapse._downloaded.clear()
+  synapse.clear_synapse_caches()
+
+
+def test_unchanged_etag_skips_download():
+  path = synapse.fetch_synapse_filepath('syn1')
+  assert synapse.fetch_synapse_filepath('syn1') == path
+  assert STUB.downloads == 1
+
+
+def test_unchanged_md5_skips_download():
+  path = synapse.fetch_synapse_filepath('syn1')
+  STUB.etag = 'etag-2'
+  assert synapse.fetch_synapse_filepath('syn1') == path
+  assert STUB.downloads == 1
+
+
+def test_changed_content_is_downloaded():
+  synapse.fetch_synapse_filepath('syn1')
+  STUB.content += b'2,Man(a1-3)Man\n'
+  STUB.etag = 'etag-2'
+  with open(synapse.fetch_synapse_filepath('syn1'), 'rb') as f:
+    assert f.read() == STUB.content
+  assert STUB.downloads == 2
+
+
+def test_concurrent_callers_share_one_download():
+  STUB.download_delay = 0.5
+  barrier = threading.Barrier(8)
+  paths = []
+
+  def fetch():
+    barrier.wait()
+    paths.append(synapse.fetch_synapse_filepath('syn1'))
+
+  threads = [threading.Thread(target=fetch) for _ in range(8)]
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  assert len(paths) == 8 and len(set(paths)) == 1
+  assert STUB.downloads == 1
+
+
+def test_userinfo_is_cached_per_token():
+  first = synapse.get_synapse_userinfo('good-1')
+  assert synapse.get_synapse_userinfo('good-1') == first
+  assert len(STUB.hits('/auth/v1/oauth2/userinfo')) == 1
+  assert synapse.get_synapse_userinfo('good-2')['token'] == 'Bearer good-2'
+  assert len(STUB.hits('/auth/v1/oauth2/userinfo')) == 2
+
+
+def test_teams_are_cached_per_user():
+  teams = synapse.get_synapse_teams('273')
+  assert teams['results'][0]['member'] == '273'
+  assert synapse.get_synapse_teams('273') == teams
+  assert len(STUB.hits('/repo/v1/user/273/team')) == 1
+
+
+def test_projects_send_token_and_are_cached():
+  projects = synapse.get_synapse_projects('good-1')
+  assert projects['results'][0]['id'] == 'syn0'
+  assert synapse.get_synapse_projects('good-1') == projects
+  assert STUB.hits('/repo/v1/projects/') == ['Bearer good-1']
+
+
+def test_error_responses_are_returned_but_not_cached():
+  for _ in range(2):
+    assert synapse.get_synapse_userinfo('expired') == {'reason': 'invalid token'}
+    assert synapse.get_synapse_projects('expired') == {'reason': 'invalid token'}
+  assert len(STUB.hits('/auth/v1/oauth2/userinfo')) == 2
+  assert len(STUB.hits('/repo/v1/projects/')) == 2
+
+
+def test_ttl_cache_drops_expired_and_oldest_entries():
+  cache = synapse.TTLCache(ttl=0.05, maxsize=3)
+  for k in range(5):
+    cache.set(k, k)
+  assert len(cache) == 3 and cache.get(0) is None and cache.get(4) == 4
+  time.sleep(0.1)
+  cache.set('new', 1)
+  assert len(cache) == 1
@@ -0,0 +1,100 @@
+import os
+import threading
+
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import pytest
+
+if not os.path.exists('pydata/df_glyco_substitution_iso2.csv'):
+  pytest.skip('the GLYSUM substitution matrix pydata/df_glyco_substitution_iso2.csv '
+              'is not in this checkout', allow_module_level=True)
+
+import glycan_alignment
+from glycan_alignment import glycobase, pairwiseAlign, submitAlignment
+
+DATABASE = glycobase.iloc[:20]
+QUERY = glycobase.glycan[1]
+KWARGS = dict(corpus=list(range(len(DATABASE))), database=DATABASE, n=5)
+PAUSE_AT = 8
+
+
+@pytest.fixture
+def paused(monkeypatch):
+  """makes jobs stop before scoring glycan PAUSE_AT until resume is set"""
+  reached = threading.Event()
+  resume = threading.Event()
+  score = glycan_alignment._scoreGlycan
+
+  def paused_score(setup, k):
+    if k == PAUSE_AT:
+      reached.set()
+      resume.wait(30)
+    return score(setup, k)
+
+  monkeypatch.setattr(glycan_alignment, '_scoreGlycan', paused_score)
+  yield reached, resume
+  resume.set()
+
+
+def test_job_matches_pairwiseAlign():
+  assert submitAlignment(QUERY, **KWARGS).result(60) == pairwiseAlign(QUERY, **KWARGS)
+  everything = dict(KWARGS, n=0)
+  assert submitAlignment(QUERY, **everything).result(60) == pairwiseAlign(QUERY, **everything)
+
+
+def test_progress_never_decreases_and_reaches_one():
+  job = submitAlignment(QUERY, **KWARGS)
+  progress = [job.progress()]
+  while not job.done():
+    progress.append(job.progress())
+  job.result(60)
+  progress.append(job.progress())
+  assert progress == sorted(progress)
+  assert progress[-1] == 1.0 and job.status() == 'finished'
+
+
+def test_partial_results_while_running(paused):
+  reached, resume = paused
+  job = submitAlignment(QUERY, **KWARGS)
+  assert reached.wait(30)
+  assert job.status() == 'running'
+  assert job.progress() == PAUSE_AT / len(DATABASE)
+  assert job.partial_results() == pairwiseAlign(QUERY, corpus=list(range(PAUSE_AT)),
+                                                database=DATABASE.iloc[:PAUSE_AT], n=5)
+  resume.set()
+  assert job.result(60) == pairwiseAlign(QUERY, **KWARGS)
+
+
+def test_cancel_running_job(paused):
+  reached, resume = paused
+  job = submitAlignment(QUERY, **KWARGS)
+  assert reached.wait(30)
+  assert job.cancel()
+  resume.set()
+  with pytest.raises(CancelledError):
+    job.result(60)
+  assert job.status() == 'cancelled'
+
+
+def test_cancel_pending_job(paused):
+  reached, resume = paused
+  executor = ThreadPoolExecutor(max_workers=1)
+  running = submitAlignment(QUERY, executor=executor, **KWARGS)
+  assert reached.wait(30)
+  pending = submitAlignment(QUERY, executor=executor, **KWARGS)
+  assert pending.status() == 'pending'
+  assert pending.cancel()
+  with pytest.raises(CancelledError):
+    pending.result(60)
+  assert pending.status() == 'cancelled'
+  resume.set()
+  assert running.result(60) == pairwiseAlign(QUERY, **KWARGS)
+  executor.shutdown()
+
+
+def test_cancel_after_completion_is_a_no_op():
+  job = submitAlignment(QUERY, **KWARGS)
+  results = job.result(60)
+  assert not job.cancel()
+  assert job.status() == 'finished'
+  assert job.result(60) == results
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+if not os.path.exists('pydata/df_glyco_substitution_iso2.csv'):
+  pytest.skip('the GLYSUM substitution matrix pydata/df_glyco_substitution_iso2.csv '
+              'is not in this checkout', allow_module_level=True)
+
+import structural_context
+from glycan_store import GlycanStore
+from glycan_processing import glycobase, df_species
+from structural_context import main_v_side_branch
+
+DATABASE = glycobase.iloc[:600]
+SPECIES = df_species[df_species.target.isin(DATABASE.glycan)]
+
+
+@pytest.fixture(scope='module')
+def full():
+  return GlycanStore.build(DATABASE, SPECIES)
+
+
+def previous_release():
+  """DATABASE/SPECIES with ~1% of glycans missing, ~1% changed and one
+  glycan's species rows missing"""
+  delta = DATABASE.sample(frac=0.02, random_state=0).glycan_id.values
+  database = DATABASE[~DATABASE.glycan_id.isin(delta[::2])].copy()
+  database.loc[database.glycan_id.isin(delta[1::2]), 'glycan'] = 'Gal(b1-4)Glc'
+  species = SPECIES[SPECIES.target != SPECIES.target.iloc[0]]
+  return database, species
+
+
+def test_sync_matches_full_build(full):
+  database, species = previous_release()
+  store = GlycanStore.build(database, species)
+  assert store.artifacts() != full.artifacts()
+  n_removed, n_updated = store.sync(DATABASE, SPECIES)
+  assert n_removed == 0 and 0 < n_updated < len(DATABASE) // 10
+  assert store.artifacts() == full.artifacts()
+
+
+def test_explicit_delta_matches_full_build(full):
+  database, species = previous_release()
+  store = GlycanStore.build(database, species)
+  added = DATABASE[~DATABASE.glycan_id.isin(database.glycan_id)]
+  before = dict(zip(database.glycan_id, database.glycan))
+  changed = DATABASE[[k in before and (before[k] != glycan or glycan == SPECIES.target.iloc[0])
+                      for k, glycan in zip(DATABASE.glycan_id, DATABASE.glycan)]]
+  store.update(added=added, changed=changed, species_df=SPECIES)
+  assert store.artifacts() == full.artifacts()
+
+  removed = DATABASE.glycan_id.values[:5].tolist()
+  store.update(removed=removed)
+  rebuilt = GlycanStore.build(DATABASE[~DATABASE.glycan_id.isin(removed)], SPECIES)
+  assert store.artifacts() == rebuilt.artifacts()
+
+
+def test_branch_counts_match_main_v_side_branch(full, monkeypatch):
+  monkeypatch.setattr(structural_context, 'df_species', SPECIES)
+  taxa = [('Kingdom', 'All')] \
+    + [('Kingdom', k) for k in SPECIES.kingdom.value_counts().index[:3]] \
+    + [('Species', k) for k in SPECIES.species.value_counts().index[:3]]
+  for taxonomy_filter, taxonomy_value in taxa:
+    for glycoletter in ['Gal', 'GlcNAc', 'Man', 'Fuc', 'a1-3', 'b1-4']:
+      assert full.main_v_side_branch(glycoletter, taxonomy_filter, taxonomy_value) \
+        == main_v_side_branch(glycoletter, taxonomy_filter, taxonomy_value)
+
+
+def test_saved_store_round_trip(full, tmp_path):
+  path = str(tmp_path / 'store.pkl')
+  full.save(path)
+  assert GlycanStore.load(path).artifacts() == full.artifacts()
@@ -0,0 +1,62 @@
+import pytest
+
+import structural_context
+from structural_context import StructuralStatistics, characterize_context, main_v_side_branch
+
+GLYCOLETTERS = ['Gal', 'GlcNAc', 'Man', 'Fuc', 'Rha', 'a1-3', 'b1-4', 'a2-6']
+MODES = ['bond', 'sugar', 'sugarbond']
+
+
+@pytest.fixture(scope='module')
+def species_slice():
+  return structural_context.df_species.iloc[::10]
+
+
+@pytest.fixture(scope='module')
+def stats(species_slice):
+  return StructuralStatistics.compute(species_slice)
+
+
+@pytest.fixture
+def per_call(species_slice, monkeypatch):
+  # the per-call functions filter the module-level df_species
+  monkeypatch.setattr(structural_context, 'df_species', species_slice)
+
+
+def taxonomy_values(species_slice):
+  kingdoms = species_slice.kingdom.value_counts().index[:3].tolist()
+  species = species_slice.species.value_counts().index[:2].tolist()
+  return ([('Kingdom', 'All'), ('Species', 'All')] + [('Kingdom', k) for k in kingdoms]
+          + [('Species', k) for k in species])
+
+
+def test_branch_lookups_match_per_call(stats, species_slice, per_call):
+  for taxonomy_filter, taxonomy_value in taxonomy_values(species_slice):
+    for glycoletter in GLYCOLETTERS:
+      assert stats.main_v_side_branch(glycoletter, taxonomy_filter, taxonomy_value) \
+        == main_v_side_branch(glycoletter, taxonomy_filter, taxonomy_value)
+
+
+def test_context_lookups_match_per_call(stats, species_slice, per_call):
+  for taxonomy_filter, taxonomy_value in taxonomy_values(species_slice):
+    for glycoletter in GLYCOLETTERS + ['NAc']:
+      for mode in MODES:
+        assert stats.characterize_context(glycoletter, mode, taxonomy_filter, taxonomy_value) \
+          == characterize_context(glycoletter, mode, taxonomy_filter, taxonomy_value)
+
+
+def test_branch_lookup_rejects_glycoletters_not_precomputed(stats, per_call):
+  assert main_v_side_branch('NAc') != (0, 0)
+  with pytest.raises(KeyError):
+    stats.main_v_side_branch('NAc')
+
+
+def test_saved_statistics_round_trip(stats, tmp_path):
+  path = str(tmp_path / 'stats.pkl')
+  stats.save(path)
+  loaded = StructuralStatistics.load(path)
+  assert 'order' not in loaded.context.columns
+  assert loaded.context.equals(stats.context) and loaded.branches.equals(stats.branches)
+  assert loaded.main_v_side_branch('Gal') == stats.main_v_side_branch('Gal')
+  with pytest.raises(KeyError):
+    loaded.main_v_side_branch('NAc')